@@ -1,2 +1,6 @@
 from .gemimg import GemImg, ImageGen
 from .grid import Grid
+from .hedge import Hedge
+from .jobs import JobQueue, SQLiteJobQueue, run_worker
+from .scheduler import PriorityClass, Scheduler
+from .utils import Derivative
@@ -1,18 +1,27 @@
+import asyncio
+import base64
+import html
+import io
 import logging
 import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
-from typing import List, Optional, Union
+from typing import AsyncIterator, ClassVar, Iterator, List, Optional, Tuple, Union
 
 import httpx
+import orjson
 from dotenv import load_dotenv
 from PIL import Image
 
-from .grid import Grid
+from .grid import Grid, plan_grids
+from .hedge import Hedge
 from .utils import (
+    Derivative,
     _validate_aspect,
     b64_to_img,
     img_b64_part,
     img_to_b64,
+    plan_payload,
     save_images_batch,
 )
 
@@ -29,6 +38,8 @@ class GemImg:
     base_url: str = field(
         default="https://generativelanguage.googleapis.com", repr=False
     )
+    timeout: float = 180
+    hedge: Optional[Hedge] = field(default=None, repr=False)
 
     def __post_init__(self):
         if not self.api_key:
@@ -56,10 +67,22 @@ class GemImg:
         image_size: str = "2K",
         system_prompt: Optional[str] = None,
         grid: Optional[Grid] = None,
+        pack: bool = False,
+        max_payload_bytes: Optional[int] = None,
+        img_priorities: Optional[List[float]] = None,
+        derivatives: Optional[List[Derivative]] = None,
     ) -> Optional["ImageGen"]:
         if not prompt and not imgs:
             raise ValueError("Either 'prompt' or 'imgs' must be provided")
 
+        # Check derivative paths up front rather than after the API call.
+        # No loop variable is left behind, as locals() is forwarded below.
+        [d.path_for(f"image.{'webp' if webp else 'png'}") for d in derivatives or []]
+
+        if pack:
+            kwargs = {k: v for k, v in locals().items() if k not in ("self", "pack")}
+            return self._generate_packed(**kwargs)
+
         # If grid is provided, use its aspect_ratio and image_size
         if grid is not None:
             if not self.is_pro:
@@ -83,8 +106,9 @@ class GemImg:
             if isinstance(imgs, (str, Image.Image)):
                 imgs = [imgs]
 
-            img_b64_strings = [img_to_b64(img, resize_inputs) for img in imgs]
-            parts.extend([img_b64_part(b64_str) for b64_str in img_b64_strings])
+            # Image data is filled in once the rest of the request is built
+            img_parts = [img_b64_part("") for _ in imgs]
+            parts.extend(img_parts)
 
         if prompt:
             parts.append({"text": prompt.strip()})
@@ -109,13 +133,41 @@ class GemImg:
                     "parts": [{"text": system_prompt.strip()}]
                 }
 
+        if imgs:
+            if max_payload_bytes:
+                # The budget covers the whole request, not only the images
+                overhead = len(orjson.dumps(query_params))
+                if overhead >= max_payload_bytes:
+                    raise ValueError(
+                        f"Request without images is already {overhead} bytes, "
+                        f"over max_payload_bytes={max_payload_bytes}"
+                    )
+                img_b64_strings = plan_payload(
+                    imgs, max_payload_bytes - overhead, img_priorities, resize_inputs
+                )
+            else:
+                img_b64_strings = [img_to_b64(img, resize_inputs) for img in imgs]
+            for img_part, b64_str in zip(img_parts, img_b64_strings):
+                img_part["inline_data"]["data"] = b64_str
+
         headers = {"Content-Type": "application/json", "x-goog-api-key": self.api_key}
         api_url = f"{self.base_url}/v1beta/models/{self.model}:generateContent"
 
-        try:
-            response = self.client.post(
-                api_url, json=query_params, headers=headers, timeout=180
+        payload = orjson.dumps(query_params)
+        logger.info(f"Request payload size: {len(payload)} bytes")
+        if max_payload_bytes and len(payload) > max_payload_bytes:
+            raise ValueError(
+                f"Request payload is {len(payload)} bytes, "
+                f"over max_payload_bytes={max_payload_bytes}"
+            )
+
+        def post() -> httpx.Response:
+            return self.client.post(
+                api_url, content=payload, headers=headers, timeout=self.timeout
             )
+
+        try:
+            response = self.hedge.run(post) if self.hedge else post()
         except httpx.TimeoutException:
             logger.error("Request Timeout")
             return None
@@ -155,12 +207,12 @@ class GemImg:
                 sliced for img in output_images for sliced in grid.slice_image(img)
             ]
 
+        response_id = response_data["responseId"]
         output_image_paths = []
         output_subimage_paths = []
         if save:
             if save_dir:
                 os.makedirs(save_dir, exist_ok=True)
-            response_id = response_data["responseId"]
             file_extension = "webp" if webp else "png"
             save_kwargs = {
                 "response_id": response_id,
@@ -168,6 +220,7 @@ class GemImg:
                 "file_extension": file_extension,
                 "store_prompt": store_prompt,
                 "prompt": prompt,
+                "derivatives": derivatives,
             }
 
             if grid is not None:
@@ -179,6 +232,14 @@ class GemImg:
             else:
                 output_image_paths = save_images_batch(output_images, **save_kwargs)
 
+        derivatives = derivatives or []
+        output_derivative_paths = [
+            [d.path_for(path) for d in derivatives] for path in output_image_paths
+        ]
+        output_subimage_derivative_paths = [
+            [d.path_for(path) for d in derivatives] for path in output_subimage_paths
+        ]
+
         return ImageGen(
             images=output_images,
             image_paths=output_image_paths,
@@ -190,11 +251,13 @@ class GemImg:
             ],
             subimages=output_subimages,
             subimage_paths=output_subimage_paths,
+            response_ids=[response_id],
+            derivative_paths=output_derivative_paths,
+            subimage_derivative_paths=output_subimage_derivative_paths,
         )
 
     def _generate_multiple(self, n: int, **kwargs) -> "ImageGen":
         """Helper to generate multiple images by accumulating results."""
-        n = kwargs.pop("n")
         result = None
         for _ in range(n):
             gen_result = self.generate(n=1, **kwargs)
@@ -204,6 +267,154 @@ class GemImg:
                 result += gen_result
         return result
 
+    def generate_iter(
+        self,
+        prompt: Optional[str] = None,
+        n: int = 1,
+        max_in_flight: int = 4,
+        **kwargs,
+    ) -> Iterator["ImageGen"]:
+        """
+        Generate n images, yielding an ImageGen per request as each completes.
+
+        At most `max_in_flight` requests run at once, and no new request is
+        started while the caller is still handling a yielded result. Failed
+        requests, including ones that raise, are logged and skipped.
+
+        Args:
+            prompt: The text prompt.
+            n: Number of requests to make.
+            max_in_flight: Maximum number of concurrent requests.
+            **kwargs: Passed to `generate`.
+
+        Yields:
+            ImageGen objects in completion order.
+        """
+        kwargs["prompt"] = prompt
+        self._validate_iter_args(n, max_in_flight, kwargs)
+
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        try:
+            pending = set()
+            submitted = 0
+            while submitted < n or pending:
+                while submitted < n and len(pending) < max_in_flight:
+                    pending.add(executor.submit(self.generate, n=1, **kwargs))
+                    submitted += 1
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        gen_result = future.result()
+                    except Exception:
+                        logger.exception("Request in generate_iter failed")
+                        continue
+                    if gen_result is not None:
+                        yield gen_result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    async def agenerate_iter(
+        self,
+        prompt: Optional[str] = None,
+        n: int = 1,
+        max_in_flight: int = 4,
+        **kwargs,
+    ) -> AsyncIterator["ImageGen"]:
+        """
+        Async counterpart of `generate_iter`.
+
+        Requests run in worker threads so the event loop is never blocked.
+
+        Args:
+            prompt: The text prompt.
+            n: Number of requests to make.
+            max_in_flight: Maximum number of concurrent requests.
+            **kwargs: Passed to `generate`.
+
+        Yields:
+            ImageGen objects in completion order.
+        """
+        kwargs["prompt"] = prompt
+        self._validate_iter_args(n, max_in_flight, kwargs)
+
+        pending = set()
+        submitted = 0
+        try:
+            while submitted < n or pending:
+                while submitted < n and len(pending) < max_in_flight:
+                    pending.add(
+                        asyncio.create_task(
+                            asyncio.to_thread(self.generate, n=1, **kwargs)
+                        )
+                    )
+                    submitted += 1
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    try:
+                        gen_result = task.result()
+                    except Exception:
+                        logger.exception("Request in agenerate_iter failed")
+                        continue
+                    if gen_result is not None:
+                        yield gen_result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    def _validate_iter_args(n: int, max_in_flight: int, kwargs: dict) -> None:
+        """Validate arguments shared by `generate_iter` and `agenerate_iter`."""
+        if n < 1 or max_in_flight < 1:
+            raise ValueError("n and max_in_flight must be positive integers")
+        if not kwargs.get("prompt") and not kwargs.get("imgs"):
+            raise ValueError("Either 'prompt' or 'imgs' must be provided")
+        if n > 1 and kwargs.get("temperature", 1.0) == 0:
+            raise ValueError(
+                "Generating multiple images at temperature = 0.0 is redundant."
+            )
+
+    def _generate_packed(
+        self,
+        n: int,
+        grid: Optional[Grid],
+        aspect_ratio: str,
+        image_size: str,
+        prompt: Optional[str] = None,
+        **kwargs,
+    ) -> Optional["ImageGen"]:
+        """Helper to generate n images as subimages of the fewest grids."""
+        if not self.is_pro:
+            raise ValueError("Grid generation requires a Pro model")
+
+        # Without a grid, each packed image targets a full single-image output
+        template = grid or Grid(
+            rows=1,
+            cols=1,
+            aspect_ratio=aspect_ratio,
+            image_size=image_size,
+            save_original_image=False,
+        )
+
+        result = None
+        for packed_grid in plan_grids(n, template):
+            gen_result = self.generate(
+                prompt=packed_grid.format_prompt(prompt) if prompt else None,
+                aspect_ratio=aspect_ratio,
+                image_size=image_size,
+                grid=packed_grid,
+                n=1,
+                **kwargs,
+            )
+            if gen_result is None:
+                continue
+            if result is None:
+                result = gen_result
+            else:
+                result += gen_result
+        return result
+
 
 @dataclass
 class Usage:
@@ -222,6 +433,16 @@ class ImageGen:
     usages: List[Usage] = field(default_factory=list)
     subimages: List[Image.Image] = field(default_factory=list)
     subimage_paths: List[str] = field(default_factory=list)
+    response_ids: List[str] = field(default_factory=list)
+    derivative_paths: List[List[str]] = field(default_factory=list)
+    subimage_derivative_paths: List[List[str]] = field(default_factory=list)
+    _html_cache: Optional[Tuple[tuple, str]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    # Notebook display settings, shared by all ImageGen objects
+    display_max_size: ClassVar[int] = 256
+    display_format: ClassVar[str] = "webp"
 
     @property
     def image(self) -> Optional[Image.Image]:
@@ -243,6 +464,10 @@ class ImageGen:
                 usages=self.usages + other.usages,
                 subimages=self.subimages + other.subimages,
                 subimage_paths=self.subimage_paths + other.subimage_paths,
+                response_ids=self.response_ids + other.response_ids,
+                derivative_paths=self.derivative_paths + other.derivative_paths,
+                subimage_derivative_paths=self.subimage_derivative_paths
+                + other.subimage_derivative_paths,
             )
         raise TypeError("Can only add ImageGen instances.")
 
@@ -262,3 +487,69 @@ class ImageGen:
             total_tokens = sum(u.total_tokens for u in self.usages)
             usage_info = f", total_tokens={total_tokens}"
         return f"ImageGen({img_info}{subimg_info}{usage_info})"
+
+    def to_html(
+        self, max_size: Optional[int] = None, full_resolution: bool = False
+    ) -> str:
+        """
+        Render the images and subimages as an HTML gallery.
+
+        Images are downscaled before encoding, so large outputs display quickly
+        and do not bloat notebooks.
+
+        Args:
+            max_size: Maximum size of each thumbnail's larger dimension.
+                Defaults to `ImageGen.display_max_size`.
+            full_resolution: Embed the original PNG pixels instead of thumbnails.
+
+        Returns:
+            An HTML string with the images inlined as data URIs.
+        """
+        max_size = max_size or self.display_max_size
+        thumbnail = Derivative(max_size=max_size, format=self.display_format)
+        pil_format = thumbnail.format.upper().replace("JPG", "JPEG")
+
+        def img_tag(img: Image.Image, title: str) -> str:
+            with io.BytesIO() as buffer:
+                if full_resolution:
+                    img.save(buffer, format="PNG")
+                    src = "data:image/png;base64,"
+                else:
+                    thumbnail.render(img).save(
+                        buffer, format=pil_format, quality=thumbnail.quality
+                    )
+                    src = f"data:image/{pil_format.lower()};base64,"
+                src += base64.b64encode(buffer.getvalue()).decode("utf-8")
+            max_width = "" if full_resolution else f"max-width: {max_size}px; "
+            return (
+                f'<img src="{src}" title="{html.escape(title)}" '
+                f'style="{max_width}margin: 2px;"/>'
+            )
+
+        rows = []
+        for imgs, paths in [
+            (self.images, self.image_paths),
+            (self.subimages, self.subimage_paths),
+        ]:
+            if imgs:
+                tags = [
+                    img_tag(img, paths[idx] if idx < len(paths) else "")
+                    for idx, img in enumerate(imgs)
+                ]
+                rows.append(
+                    f'<div style="display: flex; flex-wrap: wrap;">{"".join(tags)}</div>'
+                )
+        rows.append(f"<div><code>{html.escape(repr(self))}</code></div>")
+        return "".join(rows)
+
+    def _repr_html_(self) -> str:
+        """Jupyter rich display, cached until the display settings change."""
+        key = (
+            self.display_max_size,
+            self.display_format,
+            len(self.images),
+            len(self.subimages),
+        )
+        if self._html_cache is None or self._html_cache[0] != key:
+            self._html_cache = (key, self.to_html())
+        return self._html_cache[1]
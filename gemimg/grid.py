@@ -1,8 +1,9 @@
 """Grid class for generating images in grid layouts with Nano Banana Pro."""
 
 import logging
+import math
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from PIL import Image
 
@@ -10,6 +11,11 @@ from .utils import VALID_ASPECTS_PRO, _validate_aspect
 
 logger = logging.getLogger(__name__)
 
+# Grids larger than this tend to produce poor images or fail outright
+MAX_GRID_CELLS = 16
+
+_IMAGE_SIZE_SCALES = {"1K": 1, "2K": 2, "4K": 4}
+
 
 @dataclass
 class Grid:
@@ -24,6 +30,8 @@ class Grid:
         aspect_ratio: Aspect ratio string (e.g., "1:1", "16:9")
         image_size: Output image size ("1K", "2K", or "4K")
         save_original_image: Whether to save the original grid image before slicing
+        max_subimages: Keep only the first N cells (row-major) when slicing.
+            Defaults to all cells.
     """
 
     rows: int
@@ -31,6 +39,7 @@ class Grid:
     aspect_ratio: str = "1:1"
     image_size: str = "2K"
     save_original_image: bool = True
+    max_subimages: Optional[int] = None
 
     def __post_init__(self) -> None:
         """Validate grid parameters."""
@@ -39,7 +48,7 @@ class Grid:
                 f"Grid dimensions must be positive integers, got rows={self.rows}, cols={self.cols}"
             )
 
-        if self.rows * self.cols > 16:
+        if self.rows * self.cols > MAX_GRID_CELLS:
             logger.warning(
                 f"Grid size {self.rows}x{self.cols} ({self.rows * self.cols} cells) exceeds 16 cells. "
                 "This may result in poor image quality or generation failures."
@@ -47,11 +56,18 @@ class Grid:
 
         _validate_aspect(self.aspect_ratio, is_pro=True)
 
-        if self.image_size not in ["1K", "2K", "4K"]:
+        if self.image_size not in _IMAGE_SIZE_SCALES:
             raise ValueError(
                 f"image_size must be one of '1K', '2K', or '4K', got {self.image_size}"
             )
 
+        if self.max_subimages is not None and not (
+            1 <= self.max_subimages <= self.num_images
+        ):
+            raise ValueError(
+                f"max_subimages must be between 1 and {self.num_images}, got {self.max_subimages}"
+            )
+
     @property
     def num_images(self) -> int:
         """Number of images that will be generated in this grid.
@@ -68,15 +84,9 @@ class Grid:
         Returns:
             Tuple of (width, height) in pixels for the complete grid
         """
-        base_resolution = VALID_ASPECTS_PRO[self.aspect_ratio]
-
-        # Scale based on image_size
-        if self.image_size == "1K":
-            return base_resolution
-        elif self.image_size == "2K":
-            return (base_resolution[0] * 2, base_resolution[1] * 2)
-        else:  # "4K"
-            return (base_resolution[0] * 4, base_resolution[1] * 4)
+        base_width, base_height = VALID_ASPECTS_PRO[self.aspect_ratio]
+        scale = _IMAGE_SIZE_SCALES[self.image_size]
+        return (base_width * scale, base_height * scale)
 
     @property
     def output_resolution(self) -> Tuple[int, int]:
@@ -111,13 +121,110 @@ class Grid:
         cell_width = width // self.cols
         cell_height = height // self.rows
 
+        num_subimages = self.max_subimages or self.num_images
+
         subimages = []
-        for row in range(self.rows):
-            for col in range(self.cols):
-                left = col * cell_width
-                upper = row * cell_height
-                right = left + cell_width
-                lower = upper + cell_height
-                subimages.append(img.crop((left, upper, right, lower)))
+        for idx in range(num_subimages):
+            row, col = divmod(idx, self.cols)
+            left = col * cell_width
+            upper = row * cell_height
+            right = left + cell_width
+            lower = upper + cell_height
+            subimages.append(img.crop((left, upper, right, lower)))
 
         return subimages
+
+    def format_prompt(self, prompt: str) -> str:
+        """Fill grid layout placeholders in a prompt.
+
+        Replaces `{rows}`, `{cols}` and `{num_images}` with this grid's values,
+        so a single prompt can be reused across differently-sized grids.
+
+        Args:
+            prompt: The prompt text, optionally containing placeholders
+
+        Returns:
+            The prompt with placeholders filled
+        """
+        return (
+            prompt.replace("{rows}", str(self.rows))
+            .replace("{cols}", str(self.cols))
+            .replace("{num_images}", str(self.num_images))
+        )
+
+
+def plan_grids(n: int, template: Grid) -> List[Grid]:
+    """Plan the fewest grids that together generate `n` images.
+
+    Every planned grid has cells at least as large as `template.output_resolution`
+    with roughly the same aspect ratio, and at most `MAX_GRID_CELLS` cells. The
+    aspect ratio and image size of each grid are chosen freely to fit the layout.
+    Unused trailing cells are dropped via `max_subimages`.
+
+    Args:
+        n: Total number of images to generate
+        template: Grid whose cell resolution is the target for every image
+
+    Returns:
+        List of Grids whose kept cells sum to `n`
+    """
+    if n < 1:
+        raise ValueError(f"n must be a positive integer, got {n}")
+
+    target_width, target_height = template.output_resolution
+    target_aspect = math.log(target_width / target_height)
+
+    # (cells, scale, aspect error, squareness, rows, cols, aspect_ratio, image_size)
+    candidates = []
+    for image_size, scale in _IMAGE_SIZE_SCALES.items():
+        for aspect_ratio, (base_width, base_height) in VALID_ASPECTS_PRO.items():
+            for rows in range(1, MAX_GRID_CELLS + 1):
+                for cols in range(1, MAX_GRID_CELLS // rows + 1):
+                    cell_width = base_width * scale // cols
+                    cell_height = base_height * scale // rows
+                    if cell_width < target_width or cell_height < target_height:
+                        continue
+                    aspect_error = abs(
+                        math.log(cell_width / cell_height) - target_aspect
+                    )
+                    # Allow ~10% cell aspect ratio drift from the template
+                    if aspect_error > 0.1:
+                        continue
+                    candidates.append(
+                        (
+                            rows * cols,
+                            scale,
+                            aspect_error,
+                            abs(rows - cols),
+                            rows,
+                            cols,
+                            aspect_ratio,
+                            image_size,
+                        )
+                    )
+
+    max_cells = max(c[0] for c in candidates)
+    num_calls = math.ceil(n / max_cells)
+
+    grids = []
+    remaining = n
+    for call_idx in range(num_calls):
+        # Spread images evenly across calls to minimize wasted cells
+        needed = math.ceil(remaining / (num_calls - call_idx))
+        cells, _, _, _, rows, cols, aspect_ratio, image_size = min(
+            (c for c in candidates if c[0] >= needed),
+            key=lambda c: (c[0] - needed, c[1], c[2], c[3]),
+        )
+        grids.append(
+            Grid(
+                rows=rows,
+                cols=cols,
+                aspect_ratio=aspect_ratio,
+                image_size=image_size,
+                save_original_image=template.save_original_image,
+                max_subimages=needed if needed < cells else None,
+            )
+        )
+        remaining -= needed
+
+    return grids
@@ -0,0 +1,161 @@
+"""Hedge class for cutting the tail latency of generation requests."""
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class Hedge:
+    """Hedging policy for API requests.
+
+    If a request has not completed by the `percentile` latency of recent
+    requests, one duplicate request is issued and whichever finishes first
+    is used. The total number of duplicates is capped at `budget` times the
+    number of requests.
+
+    Each attempt runs on its own thread as soon as it is issued, so hedging
+    does not limit concurrency and the hedge delay is measured from when the
+    request is actually sent. A duplicate does hold a second connection from
+    the `httpx.Client` pool while it runs.
+
+    A duplicate that loses the race cannot be aborted mid-flight by httpx's
+    synchronous client, so its response is discarded when it arrives. Both
+    requests may be billed.
+
+    Attributes:
+        percentile: Latency percentile (0-1) after which a request is hedged
+        budget: Maximum ratio of hedged requests to total requests
+        window: Number of recent latencies used to estimate the percentile
+        min_samples: Number of latencies required before hedging starts
+    """
+
+    percentile: float = 0.95
+    budget: float = 0.1
+    window: int = 100
+    min_samples: int = 10
+    requests: int = field(default=0, init=False)
+    hedges: int = field(default=0, init=False)
+    hedge_wins: int = field(default=0, init=False)
+    latencies: Deque[float] = field(init=False, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def __post_init__(self) -> None:
+        """Validate hedging parameters."""
+        if not 0 < self.percentile < 1:
+            raise ValueError(
+                f"percentile must be between 0 and 1, got {self.percentile}"
+            )
+        if not 0 <= self.budget <= 1:
+            raise ValueError(f"budget must be between 0 and 1, got {self.budget}")
+        if self.min_samples < 1 or self.window < self.min_samples:
+            raise ValueError("window must be at least min_samples, which must be >= 1")
+
+        self.latencies = deque(maxlen=self.window)
+
+    @property
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging a request.
+
+        Returns:
+            The `percentile` latency of recent requests, or None if there are
+            not yet enough samples
+        """
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[
+            min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+        ]
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """Summary of hedging activity.
+
+        Returns:
+            Dictionary with request, hedge and hedge win counts, the hedge
+            and win rates, and the current hedge delay in seconds
+        """
+        with self._lock:
+            requests, hedges, hedge_wins = self.requests, self.hedges, self.hedge_wins
+        return {
+            "requests": requests,
+            "hedges": hedges,
+            "hedge_wins": hedge_wins,
+            "hedge_rate": hedges / requests if requests else 0.0,
+            "hedge_win_rate": hedge_wins / hedges if hedges else 0.0,
+            "delay": self.delay,
+        }
+
+    def run(self, fn: Callable[[], T]) -> T:
+        """Run a request, hedging it with a duplicate if it is slow.
+
+        Args:
+            fn: Zero-argument callable that performs the request
+
+        Returns:
+            The result of whichever attempt succeeds first
+
+        Raises:
+            Exception: The primary attempt's exception, if every attempt fails
+        """
+        delay = self.delay
+        with self._lock:
+            self.requests += 1
+
+        primary = self._start(fn)
+        if delay is None or wait([primary], timeout=delay).done:
+            return primary.result()
+
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                hedge = None
+            else:
+                self.hedges += 1
+                hedge = self._start(fn)
+        if hedge is None:
+            return primary.result()
+
+        logger.info(f"Request exceeded {delay:.1f}s, sending a hedged request")
+        attempts = {primary, hedge}
+        while attempts:
+            done, attempts = wait(attempts, return_when=FIRST_COMPLETED)
+            # Prefer the primary attempt if both finished together
+            for future in sorted(done, key=lambda f: f is not primary):
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+        return primary.result()
+
+    def _start(self, fn: Callable[[], T]) -> Future:
+        """Start an attempt on a new thread, recording its latency on success."""
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+
+        def timed() -> None:
+            start = time.monotonic()
+            try:
+                result = fn()
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            with self._lock:
+                self.latencies.append(time.monotonic() - start)
+            future.set_result(result)
+
+        threading.Thread(target=timed, daemon=True).start()
+        return future
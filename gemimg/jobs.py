@@ -0,0 +1,417 @@
+"""Shared job queues for running generation across multiple workers."""
+
+import dataclasses
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional
+
+import orjson
+
+from .grid import Grid
+from .utils import Derivative
+
+if TYPE_CHECKING:
+    from .gemimg import GemImg, ImageGen
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    """A unit of work claimed from a JobQueue.
+
+    Attributes:
+        id: The job's identifier within its queue
+        kwargs: Keyword arguments for `GemImg.generate`
+        attempts: Number of times the job has been claimed, including this one
+    """
+
+    id: int
+    kwargs: Dict[str, Any]
+    attempts: int
+
+
+class JobQueue(ABC):
+    """Interface for a job queue shared by generation workers.
+
+    Jobs are claimed with a time-limited lease that the worker extends with
+    heartbeats. Jobs whose lease expires are handed to the next worker that
+    calls `claim`, so a crashed worker never loses work.
+    """
+
+    @abstractmethod
+    def put(self, **kwargs) -> int:
+        """Add a job with `GemImg.generate` keyword arguments and return its id.
+
+        Input images must be given as file paths readable by every worker.
+        """
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        """Claim the next pending or lease-expired job, or None if there is none."""
+
+    @abstractmethod
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """Extend a job's lease. Returns False if the worker no longer holds it."""
+
+    @abstractmethod
+    def complete(
+        self,
+        job_id: int,
+        worker_id: str,
+        result: "ImageGen",
+        busy_seconds: float = 0.0,
+    ) -> bool:
+        """Record a job's result, keyed on its response IDs.
+
+        Recording the same response twice is a no-op. Returns True if this
+        call marked the job as done, which requires that no other worker has
+        since claimed it.
+        """
+
+    @abstractmethod
+    def fail(
+        self, job_id: int, worker_id: str, error: str, busy_seconds: float = 0.0
+    ) -> None:
+        """Return a failed job to the queue, or mark it failed if out of attempts.
+
+        Does nothing if another worker has since claimed the job.
+        """
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each status."""
+
+    @abstractmethod
+    def worker_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-worker job counts and throughput."""
+
+
+class SQLiteJobQueue(JobQueue):
+    """JobQueue backed by a SQLite database, which may live on a shared filesystem.
+
+    Every operation opens its own short-lived connection and takes the write
+    lock up front, so the queue is safe to share between threads and processes.
+
+    Args:
+        path: Path to the SQLite database file (created if missing)
+        max_attempts: Number of claims after which a failing job is abandoned
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kwargs BLOB NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        worker_id TEXT,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires);
+    CREATE TABLE IF NOT EXISTS results (
+        response_id TEXT PRIMARY KEY,
+        job_id INTEGER NOT NULL,
+        worker_id TEXT NOT NULL,
+        image_paths BLOB NOT NULL,
+        subimage_paths BLOB NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS workers (
+        worker_id TEXT PRIMARY KEY,
+        completed INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        images INTEGER NOT NULL DEFAULT 0,
+        busy_seconds REAL NOT NULL DEFAULT 0,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3) -> None:
+        self.path = path
+        self.max_attempts = max_attempts
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            conn.executescript(self._SCHEMA)
+        finally:
+            conn.close()
+
+    def __repr__(self) -> str:
+        return f"SQLiteJobQueue(path='{self.path}', counts={self.counts()})"
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection holding the database write lock until commit."""
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def put(self, **kwargs) -> int:
+        imgs = kwargs.get("imgs")
+        if isinstance(imgs, str):
+            imgs = [imgs]
+        if imgs is not None and not (
+            isinstance(imgs, list) and all(isinstance(img, str) for img in imgs)
+        ):
+            raise ValueError("Queue jobs must reference images by path")
+        if isinstance(kwargs.get("grid"), Grid):
+            kwargs["grid"] = dataclasses.asdict(kwargs["grid"])
+        if kwargs.get("derivatives"):
+            kwargs["derivatives"] = [
+                dataclasses.asdict(d) for d in kwargs["derivatives"]
+            ]
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kwargs) VALUES (?)", (orjson.dumps(kwargs),)
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        now = time.time()
+        with self._transaction() as conn:
+            # Expired jobs out of attempts likely crash their worker, so abandon them
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', lease_expires = NULL, "
+                "error = 'Lease expired on the final attempt' "
+                "WHERE status = 'claimed' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            # Other jobs whose lease has expired are re-queued implicitly
+            row = conn.execute(
+                "SELECT id, kwargs, attempts FROM jobs WHERE status = 'pending' "
+                "OR (status = 'claimed' AND lease_expires < ?) ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, kwargs, attempts = row
+            conn.execute(
+                "UPDATE jobs SET status = 'claimed', worker_id = ?, "
+                "lease_expires = ?, attempts = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, attempts + 1, job_id),
+            )
+            # Registers the worker so throughput includes its first job
+            self._record_worker(conn, worker_id, now)
+        return Job(id=job_id, kwargs=orjson.loads(kwargs), attempts=attempts + 1)
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'claimed'",
+                (time.time() + lease_seconds, job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def complete(
+        self,
+        job_id: int,
+        worker_id: str,
+        result: "ImageGen",
+        busy_seconds: float = 0.0,
+    ) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            for response_id in result.response_ids:
+                conn.execute(
+                    "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        response_id,
+                        job_id,
+                        worker_id,
+                        orjson.dumps(result.image_paths),
+                        orjson.dumps(result.subimage_paths),
+                        now,
+                    ),
+                )
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', lease_expires = NULL, error = NULL "
+                "WHERE id = ? AND worker_id = ? AND status != 'done'",
+                (job_id, worker_id),
+            )
+            marked_done = cursor.rowcount == 1
+            num_images = len(result.subimages) or len(result.images)
+            self._record_worker(
+                conn,
+                worker_id,
+                now,
+                completed=int(marked_done),
+                images=num_images if marked_done else 0,
+                busy_seconds=busy_seconds,
+            )
+        return marked_done
+
+    def fail(
+        self, job_id: int, worker_id: str, error: str, busy_seconds: float = 0.0
+    ) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? "
+                "THEN 'failed' ELSE 'pending' END, lease_expires = NULL, error = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'claimed'",
+                (self.max_attempts, error, job_id, worker_id),
+            )
+            self._record_worker(
+                conn,
+                worker_id,
+                now,
+                failed=int(cursor.rowcount == 1),
+                busy_seconds=busy_seconds,
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def worker_stats(self) -> Dict[str, Dict[str, float]]:
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT worker_id, completed, failed, images, busy_seconds, "
+                "first_seen, last_seen FROM workers ORDER BY worker_id"
+            ).fetchall()
+        stats = {}
+        for worker_id, completed, failed, images, busy, first, last in rows:
+            elapsed = last - first
+            stats[worker_id] = {
+                "completed": completed,
+                "failed": failed,
+                "images": images,
+                "busy_seconds": busy,
+                "jobs_per_minute": completed / elapsed * 60 if elapsed > 0 else 0.0,
+                "images_per_minute": images / elapsed * 60 if elapsed > 0 else 0.0,
+            }
+        return stats
+
+    def results(self) -> Dict[str, Dict[str, Any]]:
+        """All recorded results, keyed on response ID."""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT response_id, job_id, worker_id, image_paths, subimage_paths "
+                "FROM results ORDER BY created_at"
+            ).fetchall()
+        return {
+            response_id: {
+                "job_id": job_id,
+                "worker_id": worker_id,
+                "image_paths": orjson.loads(image_paths),
+                "subimage_paths": orjson.loads(subimage_paths),
+            }
+            for response_id, job_id, worker_id, image_paths, subimage_paths in rows
+        }
+
+    @staticmethod
+    def _record_worker(
+        conn: sqlite3.Connection,
+        worker_id: str,
+        now: float,
+        completed: int = 0,
+        failed: int = 0,
+        images: int = 0,
+        busy_seconds: float = 0.0,
+    ) -> None:
+        """Add to a worker's running totals."""
+        conn.execute(
+            "INSERT INTO workers VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (worker_id) DO UPDATE SET "
+            "completed = completed + excluded.completed, "
+            "failed = failed + excluded.failed, "
+            "images = images + excluded.images, "
+            "busy_seconds = busy_seconds + excluded.busy_seconds, "
+            "last_seen = excluded.last_seen",
+            (worker_id, completed, failed, images, busy_seconds, now, now),
+        )
+
+
+def run_worker(
+    gem_img: "GemImg",
+    queue: JobQueue,
+    worker_id: Optional[str] = None,
+    lease_seconds: float = 300,
+    poll_interval: float = 5,
+    stop_when_empty: bool = True,
+    max_jobs: Optional[int] = None,
+) -> int:
+    """Claim and run jobs from a queue until it is empty.
+
+    While a job runs, a background thread renews its lease every third of
+    `lease_seconds`, so only jobs from crashed or stalled workers expire.
+
+    Args:
+        gem_img: The GemImg client used to run jobs
+        queue: The queue to claim jobs from
+        worker_id: Unique name for this worker. Defaults to "{hostname}-{pid}".
+        lease_seconds: How long a claim is valid without a heartbeat
+        poll_interval: Seconds to wait before polling an empty queue again
+        stop_when_empty: Return once no job can be claimed, instead of polling
+        max_jobs: Return after this many jobs, if set
+
+    Returns:
+        Number of jobs this worker completed
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    num_completed = 0
+    num_claimed = 0
+
+    while max_jobs is None or num_claimed < max_jobs:
+        job = queue.claim(worker_id, lease_seconds)
+        if job is None:
+            if stop_when_empty:
+                break
+            time.sleep(poll_interval)
+            continue
+        num_claimed += 1
+
+        kwargs = dict(job.kwargs)
+        if isinstance(kwargs.get("grid"), dict):
+            kwargs["grid"] = Grid(**kwargs["grid"])
+        if kwargs.get("derivatives"):
+            kwargs["derivatives"] = [Derivative(**d) for d in kwargs["derivatives"]]
+
+        stop_heartbeat = threading.Event()
+
+        def heartbeat(job_id: int = job.id) -> None:
+            while not stop_heartbeat.wait(lease_seconds / 3):
+                if not queue.heartbeat(job_id, worker_id, lease_seconds):
+                    logger.warning(f"Worker {worker_id} lost the lease on job {job_id}")
+                    return
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+        start = time.monotonic()
+        try:
+            result = gem_img.generate(**kwargs)
+            error = None if result is not None else "No image was generated."
+        except Exception as e:
+            logger.exception(f"Job {job.id} raised an exception")
+            result, error = None, repr(e)
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+        busy_seconds = time.monotonic() - start
+
+        if error is None:
+            num_completed += queue.complete(job.id, worker_id, result, busy_seconds)
+        else:
+            queue.fail(job.id, worker_id, error, busy_seconds)
+
+    return num_completed
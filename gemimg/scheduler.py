@@ -0,0 +1,268 @@
+"""Scheduler class for sharing a GemImg client between traffic of different priorities."""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .gemimg import GemImg, ImageGen
+
+
+@dataclass
+class PriorityClass:
+    """A class of requests handled by a Scheduler.
+
+    Attributes:
+        name: Name used to submit requests to this class
+        priority: Lower values are dispatched first
+        reserved: Concurrency slots that only this class may use
+        deadline: Default seconds from submission by which a request must
+            finish. Requests that can no longer meet it are shed.
+    """
+
+    name: str
+    priority: int
+    reserved: int = 0
+    deadline: Optional[float] = None
+
+
+DEFAULT_CLASSES = [
+    PriorityClass(name="interactive", priority=0, reserved=2),
+    PriorityClass(name="bulk", priority=1),
+]
+
+
+@dataclass
+class _Request:
+    kwargs: dict
+    future: Future
+    submitted: float
+    deadline: Optional[float]
+
+
+@dataclass
+class _ClassState:
+    spec: PriorityClass
+    queue: Deque[_Request] = field(default_factory=deque)
+    running: int = 0
+    completed: int = 0
+    shed: int = 0
+    # Exponentially-weighted mean request latency, used to shed early
+    latency: Optional[float] = None
+    waits: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+
+class Scheduler:
+    """Priority-aware scheduler in front of `GemImg.generate`.
+
+    Requests are dispatched to a fixed pool of `max_concurrency` threads in
+    priority order, FIFO within a class. Slots reserved for a class are never
+    given to other classes, so bulk work cannot occupy every slot. A request
+    whose deadline cannot be met given the class's recent latency is shed
+    with a `TimeoutError` instead of being sent.
+
+    Args:
+        gem_img: The GemImg client shared by all classes
+        classes: Priority classes. Defaults to "interactive" (2 reserved
+            slots) and "bulk".
+        max_concurrency: Total number of concurrent requests
+    """
+
+    def __init__(
+        self,
+        gem_img: "GemImg",
+        classes: Optional[List[PriorityClass]] = None,
+        max_concurrency: int = 8,
+    ) -> None:
+        classes = classes or DEFAULT_CLASSES
+        total_reserved = sum(c.reserved for c in classes)
+        if total_reserved > max_concurrency:
+            raise ValueError("Reserved slots cannot exceed max_concurrency")
+        if total_reserved == max_concurrency and any(c.reserved == 0 for c in classes):
+            raise ValueError(
+                "Classes without reserved slots would never run: "
+                "leave at least one slot of max_concurrency unreserved"
+            )
+
+        self.gem_img = gem_img
+        self.max_concurrency = max_concurrency
+        self._classes: Dict[str, _ClassState] = {
+            c.name: _ClassState(spec=c)
+            for c in sorted(classes, key=lambda c: c.priority)
+        }
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._workers = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(max_concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self) -> "Scheduler":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+    def submit(
+        self, priority_class: str, deadline: Optional[float] = None, **kwargs
+    ) -> "Future[Optional[ImageGen]]":
+        """Queue a `generate` call.
+
+        Args:
+            priority_class: Name of the class to submit to
+            deadline: Seconds from now by which the request must finish.
+                Defaults to the class's deadline.
+            **kwargs: Passed to `GemImg.generate`
+
+        Returns:
+            A Future resolving to the `generate` result, or raising
+            `TimeoutError` if the request was shed
+        """
+        if priority_class not in self._classes:
+            raise ValueError(
+                f"Unknown priority class '{priority_class}'. "
+                f"Available classes: {', '.join(self._classes)}"
+            )
+
+        state = self._classes[priority_class]
+        deadline = deadline if deadline is not None else state.spec.deadline
+        now = time.monotonic()
+        request = _Request(
+            kwargs=kwargs,
+            future=Future(),
+            submitted=now,
+            deadline=now + deadline if deadline is not None else None,
+        )
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("Cannot submit to a Scheduler after shutdown")
+            state.queue.append(request)
+            self._cond.notify_all()
+        return request.future
+
+    def generate(
+        self, priority_class: str, deadline: Optional[float] = None, **kwargs
+    ) -> Optional["ImageGen"]:
+        """Queue a `generate` call and wait for its result.
+
+        Raises:
+            TimeoutError: If the request was shed to meet its deadline
+        """
+        return self.submit(priority_class, deadline, **kwargs).result()
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-class queue depth, throughput and queue wait times in seconds."""
+        with self._cond:
+            stats = {}
+            for name, state in self._classes.items():
+                waits = sorted(state.waits)
+                stats[name] = {
+                    "queued": len(state.queue),
+                    "running": state.running,
+                    "completed": state.completed,
+                    "shed": state.shed,
+                    "wait_mean": sum(waits) / len(waits) if waits else 0.0,
+                    "wait_p95": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                    "wait_max": waits[-1] if waits else 0.0,
+                }
+        return stats
+
+    def shutdown(self, cancel_pending: bool = False) -> None:
+        """Stop the scheduler once queued requests finish.
+
+        Args:
+            cancel_pending: Cancel queued requests instead of running them
+        """
+        with self._cond:
+            self._stopping = True
+            if cancel_pending:
+                for state in self._classes.values():
+                    while state.queue:
+                        state.queue.popleft().future.cancel()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def _next_request(self) -> Optional[Tuple[_ClassState, _Request]]:
+        """Pick the next dispatchable request. Must hold `self._cond`."""
+        now = time.monotonic()
+        running = sum(s.running for s in self._classes.values())
+        unused_reserved = {
+            name: max(0, s.spec.reserved - s.running)
+            for name, s in self._classes.items()
+        }
+        total_unused_reserved = sum(unused_reserved.values())
+
+        for name, state in self._classes.items():
+            self._shed_expired(state, now)
+            if not state.queue:
+                continue
+            # Slots held back for other classes' reservations are off limits
+            others_reserved = total_unused_reserved - unused_reserved[name]
+            if running + others_reserved < self.max_concurrency:
+                request = state.queue.popleft()
+                state.running += 1
+                return state, request
+        return None
+
+    def _shed_expired(self, state: _ClassState, now: float) -> None:
+        """Fail queued requests that can no longer meet their deadline."""
+        expected = state.latency or 0.0
+        kept = deque()
+        for request in state.queue:
+            if request.future.cancelled():
+                continue
+            if request.deadline is not None and now + expected > request.deadline:
+                # Claims the future so a concurrent cancel() cannot race set_exception
+                if not request.future.set_running_or_notify_cancel():
+                    continue
+                state.shed += 1
+                request.future.set_exception(
+                    TimeoutError(
+                        f"Request in class '{state.spec.name}' shed: "
+                        f"cannot finish within its deadline"
+                    )
+                )
+            else:
+                kept.append(request)
+        state.queue = kept
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while (next_request := self._next_request()) is None:
+                    if self._stopping and not any(
+                        s.queue for s in self._classes.values()
+                    ):
+                        return
+                    # Wake periodically so deadlines are checked while waiting
+                    self._cond.wait(timeout=1.0)
+                state, request = next_request
+
+            start = time.monotonic()
+            ran = request.future.set_running_or_notify_cancel()
+            if ran:
+                try:
+                    request.future.set_result(self.gem_img.generate(**request.kwargs))
+                except Exception as e:
+                    request.future.set_exception(e)
+            latency = time.monotonic() - start
+
+            with self._cond:
+                state.running -= 1
+                self._cond.notify_all()
+                if not ran:
+                    continue
+                state.completed += 1
+                state.waits.append(start - request.submitted)
+                state.latency = (
+                    latency
+                    if state.latency is None
+                    else 0.8 * state.latency + 0.2 * latency
+                )
@@ -1,8 +1,11 @@
 import base64
 import io
 import math
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Deque, Dict, Iterator, List, Optional, Tuple, Union
 
 from PIL import Image, PngImagePlugin
 
@@ -103,13 +106,18 @@ def resize_image(img: Image.Image, max_size: int = 1024) -> Image.Image:
     return img.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
 
-def img_to_b64(img: Union[str, Image.Image], resize: bool = True) -> str:
+def img_to_b64(
+    img: Union[str, Image.Image],
+    resize: bool = True,
+    quality: Optional[int] = None,
+) -> str:
     """
     Convert an input image (or path to an image) to a base64-encoded string.
 
     Args:
         img: The image or path to the image.
         resize: Whether to resize the image before encoding.
+        quality: WEBP quality (0-100). Defaults to Pillow's default.
 
     Returns:
         The base64-encoded string of the image.
@@ -119,12 +127,95 @@ def img_to_b64(img: Union[str, Image.Image], resize: bool = True) -> str:
     if resize:
         img = resize_image(img)
 
+    save_kwargs = {} if quality is None else {"quality": quality}
     with io.BytesIO() as buffer:
-        img.save(buffer, format="WEBP")
+        img.save(buffer, format="WEBP", **save_kwargs)
         img_bytes = buffer.getvalue()
     return base64.b64encode(img_bytes).decode("utf-8")
 
 
+# Encoding ladder used by `plan_payload`, from best to smallest:
+# (fraction of the input dimensions, WEBP quality)
+_PAYLOAD_LADDER: List[Tuple[float, Optional[int]]] = [
+    (1.0, None),
+    (1.0, 70),
+    (1.0, 55),
+    (0.75, 70),
+    (0.75, 55),
+    (0.5, 55),
+    (0.5, 40),
+    (0.375, 40),
+    (0.25, 40),
+]
+
+
+def plan_payload(
+    imgs: List[Union[str, Image.Image]],
+    max_bytes: int,
+    priorities: Optional[List[float]] = None,
+    resize: bool = True,
+) -> List[str]:
+    """
+    Encode input images so their combined base64 size fits a byte budget.
+
+    Every image starts at the default `img_to_b64` encoding. While the total is
+    over budget, the image with the largest size relative to its priority is
+    stepped down to a lower quality and/or resolution, so images with a higher
+    priority keep more detail.
+
+    Args:
+        imgs: List of images or paths to images.
+        max_bytes: Maximum combined size of the base64-encoded images.
+        priorities: Relative importance of each image (default: all 1.0).
+        resize: Whether to resize images to a 1024px max dimension first.
+
+    Returns:
+        List of base64-encoded image strings, in input order.
+
+    Raises:
+        ValueError: If the images cannot fit the budget at the lowest quality
+    """
+    if priorities is None:
+        priorities = [1.0] * len(imgs)
+    if len(priorities) != len(imgs):
+        raise ValueError("priorities must have the same length as imgs")
+    if any(p <= 0 for p in priorities):
+        raise ValueError("priorities must be positive")
+
+    bases = []
+    for img in imgs:
+        if isinstance(img, str):
+            img = Image.open(img)
+        bases.append(resize_image(img) if resize else img)
+
+    def encode(idx: int, rung: int) -> str:
+        scale, quality = _PAYLOAD_LADDER[rung]
+        img = bases[idx]
+        if scale < 1.0:
+            new_size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+            img = img.resize(new_size, Image.Resampling.LANCZOS)
+        return img_to_b64(img, resize=False, quality=quality)
+
+    rungs = [0] * len(bases)
+    encoded = [encode(idx, 0) for idx in range(len(bases))]
+    total = sum(len(b64) for b64 in encoded)
+
+    while total > max_bytes:
+        reducible = [idx for idx, r in enumerate(rungs) if r < len(_PAYLOAD_LADDER) - 1]
+        if not reducible:
+            raise ValueError(
+                f"Input images cannot fit in {max_bytes} bytes "
+                f"(smallest encoding is {total} bytes)"
+            )
+        idx = max(reducible, key=lambda i: len(encoded[i]) / priorities[i])
+        rungs[idx] += 1
+        b64 = encode(idx, rungs[idx])
+        total += len(b64) - len(encoded[idx])
+        encoded[idx] = b64
+
+    return encoded
+
+
 def b64_to_img(img_b64: str) -> Image.Image:
     """
     Convert a base64-encoded image string into a PIL Image object.
@@ -175,6 +266,80 @@ def save_image(
         img.save(path)
 
 
+@dataclass
+class Derivative:
+    """
+    A downscaled copy of each saved image, written next to the original.
+
+    Attributes:
+        max_size: Maximum size of the larger dimension, in pixels.
+        format: File format/extension, e.g. "webp", "jpg" or "png".
+        quality: Encoder quality for lossy formats.
+        suffix: Appended to the original filename stem. Defaults to "@{max_size}".
+    """
+
+    max_size: int
+    format: str = "webp"
+    quality: int = 80
+    suffix: Optional[str] = None
+
+    def path_for(self, image_path: str) -> str:
+        """
+        Path of this derivative for a saved image path.
+
+        Raises:
+            ValueError: If the derivative would overwrite the original image
+        """
+        path = Path(image_path)
+        suffix = self.suffix if self.suffix is not None else f"@{self.max_size}"
+        derivative_path = path.with_name(f"{path.stem}{suffix}.{self.format}")
+        if derivative_path == path:
+            raise ValueError(
+                f"Derivative path {derivative_path} would overwrite the original "
+                "image. Use a non-empty suffix or a different format."
+            )
+        return str(derivative_path)
+
+    def render(self, img: Image.Image) -> Image.Image:
+        """Downscale an image to this derivative's size."""
+        scale = self.max_size / max(img.size)
+        if scale < 1.0:
+            new_size = (
+                max(1, round(img.width * scale)),
+                max(1, round(img.height * scale)),
+            )
+            img = fast_resize(img, new_size)
+        if self.format.lower() in ["jpg", "jpeg"] and img.mode not in ["RGB", "L"]:
+            img = img.convert("RGB")
+        return img
+
+
+def save_derivatives(
+    img: Image.Image, path: str, derivatives: List[Derivative]
+) -> List[str]:
+    """
+    Save downscaled derivatives of an image next to its saved path.
+
+    Args:
+        img: The already-decoded PIL Image.
+        path: The file path the original image was saved to.
+        derivatives: The derivatives to create.
+
+    Returns:
+        List of derivative file paths, in the order of `derivatives`.
+    """
+    # Render from largest to smallest so each derivative downscales the previous one
+    order = sorted(
+        range(len(derivatives)), key=lambda i: derivatives[i].max_size, reverse=True
+    )
+    derivative_paths = [derivative.path_for(path) for derivative in derivatives]
+    source = img
+    for idx in order:
+        source = derivatives[idx].render(source)
+        source.save(derivative_paths[idx], quality=derivatives[idx].quality)
+    return derivative_paths
+
+
 def save_images_batch(
     images: List[Image.Image],
     response_id: str,
@@ -182,6 +347,7 @@ def save_images_batch(
     file_extension: str,
     store_prompt: bool = False,
     prompt: Optional[str] = None,
+    derivatives: Optional[List[Derivative]] = None,
 ) -> List[str]:
     """
     Save a batch of images with consistent naming and return their paths.
@@ -193,6 +359,9 @@ def save_images_batch(
         file_extension: File extension (e.g., "png", "webp").
         store_prompt: Whether to store the prompt in PNG metadata.
         prompt: The prompt text to store in metadata.
+        derivatives: Downscaled copies to write next to each image, created
+            from the same decoded pixels. Their paths are given by
+            `Derivative.path_for`.
 
     Returns:
         List of relative image paths that were saved.
@@ -203,81 +372,322 @@ def save_images_batch(
         image_path = f"{response_id}{suffix}.{file_extension}"
         full_path = Path(save_dir) / image_path
         save_image(img, str(full_path), store_prompt, prompt)
+        if derivatives:
+            save_derivatives(img, str(full_path), derivatives)
         saved_paths.append(image_path)
     return saved_paths
 
 
+def _composite_grid_dims(
+    num_images: int, rows: Optional[int] = None, cols: Optional[int] = None
+) -> Tuple[int, int]:
+    """
+    Resolve the rows and columns of a composite grid for a number of images.
+
+    Args:
+        num_images: Number of images to place in the grid.
+        rows: Number of rows in the grid. If None, will be calculated based on cols
+        cols: Number of columns in the grid. If None, will be calculated based on rows
+
+    Returns:
+        Tuple of (rows, cols)
+
+    Raises:
+        ValueError: If the grid is too small for the number of images
+    """
+    if rows is None and cols is None:
+        # Default to roughly square grid
+        cols = math.ceil(math.sqrt(num_images))
+        rows = math.ceil(num_images / cols)
+    elif rows is None:
+        rows = math.ceil(num_images / cols)
+    elif cols is None:
+        cols = math.ceil(num_images / rows)
+
+    # Validate that grid can accommodate all images
+    if rows * cols < num_images:
+        raise ValueError(f"Grid size {rows}x{cols} too small for {num_images} images")
+
+    return rows, cols
+
+
+def _resample_mode(img: Image.Image) -> str:
+    """Mode an image must be in to be reduced and resampled."""
+    if img.mode in ["P", "PA", "1"]:
+        has_alpha = img.mode == "PA" or "transparency" in img.info
+        return "RGBA" if has_alpha else "RGB"
+    return img.mode
+
+
+def fast_resize(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """
+    Resize an image, using `Image.reduce()` for the bulk of large downscales.
+
+    Reducing by an integer factor first is much cheaper than resampling the
+    full-resolution image, with little visible difference at thumbnail sizes.
+
+    Args:
+        img: The PIL Image to resize.
+        size: The target (width, height).
+
+    Returns:
+        The resized PIL Image.
+    """
+    # Palette and bilevel images cannot be reduced or resampled smoothly
+    if (mode := _resample_mode(img)) != img.mode:
+        img = img.convert(mode)
+
+    factor = min(img.width // size[0], img.height // size[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.size != size:
+        img = img.resize(size, Image.Resampling.LANCZOS)
+    return img
+
+
+def fit_image(
+    img: Image.Image,
+    size: Tuple[int, int],
+    fit: str = "contain",
+    background_color: Union[str, Tuple[int, int, int]] = "white",
+) -> Image.Image:
+    """
+    Fit an image into a cell of the given size.
+
+    Args:
+        img: The PIL Image to fit.
+        size: The (width, height) of the cell.
+        fit: "contain" to letterbox the image inside the cell, "cover" to
+            fill the cell and crop the overflow, or "stretch" to ignore the
+            aspect ratio.
+        background_color: Letterbox color for "contain".
+
+    Returns:
+        A PIL Image of exactly `size`.
+    """
+    if fit not in ["contain", "cover", "stretch"]:
+        raise ValueError("fit must be one of 'contain', 'cover', or 'stretch'")
+
+    if img.size == size:
+        return img
+
+    cell_width, cell_height = size
+    width, height = img.size
+    if fit == "stretch":
+        target = size
+    else:
+        pick = min if fit == "contain" else max
+        scale = pick(cell_width / width, cell_height / height)
+        target = (max(1, round(width * scale)), max(1, round(height * scale)))
+
+    img = fast_resize(img, target)
+
+    if fit == "cover" and img.size != size:
+        left = (img.width - cell_width) // 2
+        upper = (img.height - cell_height) // 2
+        img = img.crop((left, upper, left + cell_width, upper + cell_height))
+    elif fit == "contain" and img.size != size:
+        cell = Image.new(img.mode, size, background_color)
+        cell.paste(
+            img, ((cell_width - img.width) // 2, (cell_height - img.height) // 2)
+        )
+        img = cell
+
+    return img
+
+
+def _load_tile(
+    img: Union[str, Image.Image],
+    cell_size: Tuple[int, int],
+    mode: str,
+    fit: str,
+    background_color: Union[str, Tuple[int, int, int]],
+) -> Image.Image:
+    """Load a single composite tile at cell size, closing any file it opens."""
+    if not isinstance(img, str):
+        if img.mode != mode:
+            img = img.convert(mode)
+        return fit_image(img, cell_size, fit, background_color)
+
+    with Image.open(img) as src:
+        # JPEG can decode directly at a reduced scale
+        src.draft(mode, cell_size)
+        tile = src if src.mode == mode else src.convert(mode)
+        tile = fit_image(tile, cell_size, fit, background_color)
+        if tile is src:
+            tile = src.copy()
+    return tile
+
+
+def _iter_tiles(
+    images: List[Union[str, Image.Image]],
+    cell_size: Tuple[int, int],
+    mode: str,
+    fit: str,
+    background_color: Union[str, Tuple[int, int, int]],
+    max_workers: int,
+) -> Iterator[Image.Image]:
+    """
+    Decode and fit tiles in parallel, yielding them in input order.
+
+    At most `2 * max_workers` tiles are in flight at once so memory stays
+    bounded regardless of the number of images.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending: Deque[Future] = deque()
+        for img in images:
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+            pending.append(
+                executor.submit(_load_tile, img, cell_size, mode, fit, background_color)
+            )
+        while pending:
+            yield pending.popleft().result()
+
+
+def _composite_layout(
+    images: List[Union[str, Image.Image]],
+    rows: Optional[int],
+    cols: Optional[int],
+    cell_size: Optional[Tuple[int, int]],
+) -> Tuple[int, int, Tuple[int, int], str]:
+    """Resolve grid dimensions, cell size and mode from the first image header."""
+    if not images:
+        raise ValueError("Images list cannot be empty")
+
+    rows, cols = _composite_grid_dims(len(images), rows, cols)
+
+    # Only the header of the first image is read here
+    first = images[0]
+    if isinstance(first, str):
+        with Image.open(first) as first_img:
+            first_size, mode = first_img.size, _resample_mode(first_img)
+    else:
+        first_size, mode = first.size, _resample_mode(first)
+
+    return rows, cols, cell_size or first_size, mode
+
+
 def composite_images(
     images: List[Union[str, Image.Image]],
     rows: Optional[int] = None,
     cols: Optional[int] = None,
     background_color: Union[str, Tuple[int, int, int]] = "white",
+    cell_size: Optional[Tuple[int, int]] = None,
+    fit: str = "contain",
+    max_workers: int = 4,
 ) -> Image.Image:
     """
     Composite multiple images into a single grid image.
 
+    Images are decoded, downscaled and pasted one at a time, so only the
+    output canvas and a few tiles are held in memory.
+
     Args:
         images: List of file paths (strings) or PIL Image objects
         rows: Number of rows in the grid. If None, will be calculated based on cols
         cols: Number of columns in the grid. If None, will be calculated based on rows
         background_color: Background color for empty cells (default: "white")
+        cell_size: (width, height) of each cell. Defaults to the size of the first image.
+        fit: How images that do not match `cell_size` are fit: "contain", "cover" or "stretch"
+        max_workers: Number of threads used to decode images in parallel
 
     Returns:
         PIL Image object containing the composite grid
 
     Raises:
-        ValueError: If no rows or cols specified, or if images list is empty
+        ValueError: If the grid is too small, or if images list is empty
         FileNotFoundError: If a file path doesn't exist
     """
+    rows, cols, cell_size, mode = _composite_layout(images, rows, cols, cell_size)
+    cell_width, cell_height = cell_size
 
-    if not images:
-        raise ValueError("Images list cannot be empty")
+    composite = Image.new(
+        mode, (cols * cell_width, rows * cell_height), background_color
+    )
 
-    # Load all images and ensure they're PIL Image objects
-    loaded_images: List[Image.Image] = []
-    for img in images:
-        if isinstance(img, str):
-            # It's a file path
-            loaded_images.append(Image.open(img))
-        else:
-            # It's already a PIL Image
-            loaded_images.append(img)
+    tiles = _iter_tiles(images, cell_size, mode, fit, background_color, max_workers)
+    for idx, tile in enumerate(tiles):
+        row = idx // cols
+        col = idx % cols
+        composite.paste(tile, (col * cell_width, row * cell_height))
 
-    num_images = len(loaded_images)
+    return composite
 
-    # Calculate grid dimensions
-    if rows is None and cols is None:
-        # Default to roughly square grid
-        cols = math.ceil(math.sqrt(num_images))
-        rows = math.ceil(num_images / cols)
-    elif rows is None:
-        rows = math.ceil(num_images / cols)
-    elif cols is None:
-        cols = math.ceil(num_images / rows)
 
-    # Validate that grid can accommodate all images
-    if rows * cols < num_images:
-        raise ValueError(f"Grid size {rows}x{cols} too small for {num_images} images")
+def iter_composite_strips(
+    images: List[Union[str, Image.Image]],
+    rows: Optional[int] = None,
+    cols: Optional[int] = None,
+    rows_per_strip: int = 1,
+    background_color: Union[str, Tuple[int, int, int]] = "white",
+    cell_size: Optional[Tuple[int, int]] = None,
+    fit: str = "contain",
+    max_workers: int = 4,
+) -> Iterator[Image.Image]:
+    """
+    Composite multiple images into a grid, yielding it as horizontal strips.
 
-    # Get dimensions from the first image (assuming all are equal as per requirements)
-    img_width, img_height = loaded_images[0].size
+    Stacking the strips top-to-bottom gives the same result as
+    `composite_images`, but only one strip is held in memory at a time,
+    which allows contact sheets far larger than available RAM.
 
-    # Create the composite image
-    composite_width = cols * img_width
-    composite_height = rows * img_height
+    Args:
+        images: List of file paths (strings) or PIL Image objects
+        rows: Number of rows in the grid. If None, will be calculated based on cols
+        cols: Number of columns in the grid. If None, will be calculated based on rows
+        rows_per_strip: Number of grid rows in each strip
+        background_color: Background color for empty cells (default: "white")
+        cell_size: (width, height) of each cell. Defaults to the size of the first image.
+        fit: How images that do not match `cell_size` are fit: "contain", "cover" or "stretch"
+        max_workers: Number of threads used to decode images in parallel
 
-    # Determine mode based on first image
-    mode = loaded_images[0].mode
-    composite = Image.new(mode, (composite_width, composite_height), background_color)
+    Yields:
+        PIL Image objects for each strip, from top to bottom
+    """
+    if rows_per_strip < 1:
+        raise ValueError("rows_per_strip must be a positive integer")
+
+    rows, cols, cell_size, mode = _composite_layout(images, rows, cols, cell_size)
+    cell_width, cell_height = cell_size
+    cells_per_strip = rows_per_strip * cols
+
+    tiles = _iter_tiles(images, cell_size, mode, fit, background_color, max_workers)
+    for strip_row in range(0, rows, rows_per_strip):
+        strip_rows = min(rows_per_strip, rows - strip_row)
+        strip = Image.new(
+            mode, (cols * cell_width, strip_rows * cell_height), background_color
+        )
+        for idx, tile in zip(range(cells_per_strip), tiles):
+            row = idx // cols
+            col = idx % cols
+            strip.paste(tile, (col * cell_width, row * cell_height))
+        yield strip
 
-    # Place images in the grid
-    for idx, img in enumerate(loaded_images):
-        row = idx // cols
-        col = idx % cols
 
-        x_offset = col * img_width
-        y_offset = row * img_height
+def save_composite_strips(
+    images: List[Union[str, Image.Image]],
+    name: str,
+    save_dir: str = "",
+    file_extension: str = "png",
+    **kwargs,
+) -> List[str]:
+    """
+    Composite multiple images into a grid and save it as a series of strips.
 
-        composite.paste(img, (x_offset, y_offset))
+    Args:
+        images: List of file paths (strings) or PIL Image objects
+        name: The filename base for the strips.
+        save_dir: Directory to save strips in.
+        file_extension: File extension (e.g., "png", "webp").
+        **kwargs: Passed to `iter_composite_strips`.
 
-    return composite
+    Returns:
+        List of relative strip paths that were saved, from top to bottom.
+    """
+    saved_paths = []
+    for idx, strip in enumerate(iter_composite_strips(images, **kwargs)):
+        strip_path = f"{name}-{idx:02d}.{file_extension}"
+        strip.save(Path(save_dir) / strip_path)
+        saved_paths.append(strip_path)
+    return saved_paths